@@ -11,6 +11,8 @@ import json
 import logging
 import importlib
 
+from sharding.sharding import database_fingerprint
+
 class FileClassifier:
 
     METHODS = ['exts', 'ml', 'mixed']
@@ -20,7 +22,8 @@ class FileClassifier:
     # mixed - use a combination of both the ML model and mixed model (Todo)
     
     def __init__(self, json_db, method='exts',
-                 print_db_info=True, classifier_model=None, external_plugin_list=None):
+                 print_db_info=True, classifier_model=None, external_plugin_list=None,
+                 shard=None, shard_plan=None):
         """Initialize the classifier
 
         Args:
@@ -29,12 +32,21 @@ class FileClassifier:
             classifier_model (str, optional): Location of the model to use. Defaults to None.
             external_plugin_list (str, optional): Location of an external plugin list to use instead
             of the internal one
+            shard (tuple, optional): (shard_index, shard_count) to only classify one shard of the
+            database. Defaults to None.
+            shard_plan (str, optional): Location of the shard plan. Required if and only if shard
+            is specified.
         """
 
         # Check if a valid method was specified
         if method not in self.METHODS:
             raise ValueError("Invalid Classification Method. Options are exts, ml, or mixed.")
 
+        # Check that we were given both a shard and a plan, or neither. A plan on its own would
+        # classify and overwrite the whole database, which is what sharding is meant to avoid.
+        if bool(shard) != bool(shard_plan):
+            raise ValueError("A shard and a shard plan must be specified together.")
+
         self.version = "dev-1.0"
 
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -53,6 +65,13 @@ class FileClassifier:
         # To update the plugin list if the the last update time is over two weeks, and notify them
         # that they can use python3 curator_tool.py --update_plugin_list to update the list
         self.external_plugin_list = external_plugin_list
+        self.shard = shard
+        self.shard_plan = shard_plan
+
+        # When classifying a shard, write our own segment instead of overwriting the database
+        self.output_db = json_db
+        if self.shard:
+            self.output_db = "{}.shard-{}-of-{}.json".format(os.path.splitext(json_db)[0], *shard)
 
         # Create a method map for mapping classifications to their respective
         # functions in the class
@@ -132,6 +151,10 @@ class FileClassifier:
         if self.classifier_model and not os.path.isfile(self.classifier_model):
             raise FileNotFoundError("Classifier Model Not Found.")
 
+        # Check the shard plan, if specified
+        if self.shard_plan and not os.path.isfile(self.shard_plan):
+            raise FileNotFoundError("Shard Plan Not Found.")
+
         # Next, check the Internal or external plugin database
         plugin_database = self.external_plugin_list or self.internal_plugin_list
         if not os.path.isfile(plugin_database):
@@ -179,6 +202,43 @@ class FileClassifier:
 
         self.logger.info("Finished loading backend database")
 
+    def _select_shard(self):
+        # Only keep the files that the shard plan assigned to us
+        shard_index, shard_count = self.shard
+        self.logger.info(f"Selecting shard {shard_index}/{shard_count}")
+
+        with open(self.shard_plan, encoding="utf-8", mode="r") as plan_file:
+            plan = json.load(plan_file)
+
+        # Match the plan on the database's contents rather than its path, nodes may mount it elsewhere
+        if plan["shard_info"]["database_fingerprint"] != database_fingerprint(self._database["files"]):
+            raise ValueError(f"Shard plan was made for a different database than {self.json_db}. "
+                             f"Was it re-imported after planning? Re-run the planner.")
+
+        if plan["shard_info"]["shard_count"] != shard_count:
+            raise ValueError(f"Shard plan has {plan['shard_info']['shard_count']} shard(s), not {shard_count}.")
+
+        # Every file has to belong to some shard, otherwise it silently falls through the cracks
+        planned_files = set().union(*(set(shard["files"]) for shard in plan["shards"]))
+        unplanned_files = [gathered_file["full_path"] for gathered_file in self._database["files"]
+                           if gathered_file["full_path"] not in planned_files]
+        if unplanned_files:
+            raise ValueError(f"{len(unplanned_files)} file(s) in {self.json_db} are not in any shard, "
+                             f"e.g. {unplanned_files[0]}. Re-run the planner.")
+
+        shard_files = set(plan["shards"][shard_index]["files"])
+        self._database["files"] = [gathered_file for gathered_file in self._database["files"]
+                                   if gathered_file["full_path"] in shard_files]
+
+        # Tag the segment so the merger can tell where it came from
+        self._database["shard"] = {
+            "shard_index": shard_index,
+            "shard_count": shard_count,
+            "plan_fingerprint": plan["shard_info"]["fingerprint"]
+        }
+
+        self.logger.info(f"Shard {shard_index}/{shard_count} contains {len(self._database['files'])} file(s)")
+
     def _print_database_info(self):
         # Print misc. database info that might be useful to the user
         database_authors = ",".join(self._database["header"]["authors"])
@@ -215,7 +275,7 @@ class FileClassifier:
         self.logger.info("exts classification finished. Recreating DB.")
 
         # Now actually write it
-        with open(self.json_db, encoding="utf-8", mode="w") as json_file_db:
+        with open(self.output_db, encoding="utf-8", mode="w") as json_file_db:
             json.dump(self._database, json_file_db)
 
         self.logger.info("Finished recreating DB. Process Complete.")
@@ -239,6 +299,9 @@ class FileClassifier:
         self._generate_plugin_map()
         # load the file database
         self._load_database()
+        # Narrow the database down to our shard if specified
+        if self.shard:
+            self._select_shard()
         # Print the database information if specified
         if self.print_db_info:
             self._print_database_info()
@@ -1,6 +1,7 @@
 # Open Asterisk Curator Tool
 import importlib
 import classifier.classifier as classifier
+import sharding.sharding as sharding
 import backend
 import argparse
 
@@ -52,16 +53,42 @@ classifier_parser.add_argument('-m', '--method', required=True, choices=['exts',
 classifier_parser.add_argument('-si', '--show_info', action='store_true', help='Display database information')
 classifier_parser.add_argument('-cm', '--classifier_model', help='The path to the ML classifier model to use')
 classifier_parser.add_argument('-ex', '--external_plugin_db', help='External plugin database to use instead of the internal one')
+classifier_parser.add_argument('--shard', type=sharding.shard_spec_argument, help='Only classify shard i/N and write it to its own segment')
+classifier_parser.add_argument('-sp', '--shard_plan', help='The path to the shard plan, required with --shard')
+
+planner_parser = subparsers.add_parser('plan')
+planner_parser.add_argument('-db', '--database', required=True, help='The path to the database')
+planner_parser.add_argument('-odir', '--output_directory', required=True, help='The directory to write the shard plan to')
+planner_parser.add_argument('-n', '--shard_count', required=True, type=int, help='The number of shards to split the database into')
+planner_parser.add_argument('-k', '--key', default='path', choices=['path', 'content'], help='Partition by path hash or content hash')
+
+merger_parser = subparsers.add_parser('merge')
+merger_parser.add_argument('-sp', '--shard_plan', required=True, help='The path to the shard plan')
+merger_parser.add_argument('-s', '--segments', required=True, nargs='+', help='The shard segments to merge')
+merger_parser.add_argument('-o', '--output_database', required=True, help='The path to write the merged database to')
 
 args = parser.parse_args()
 
+if args.command == 'classify' and bool(args.shard) != bool(args.shard_plan):
+    classifier_parser.error('--shard and -sp/--shard_plan must be used together')
+
 if args.command == 'import':
     backend_import = backend.BackendImporter(args.import_directory, args.output_directory, args.recursive)
     print(BANNER)
     backend_import.commence_import()
 
 if args.command == 'classify':
-    classifier = classifier.FileClassifier(args.database, args.method, args.show_info, args.classifier_model, args.external_plugin_db)
+    classifier = classifier.FileClassifier(args.database, args.method, args.show_info, args.classifier_model, args.external_plugin_db,
+                                           args.shard, args.shard_plan)
     print(BANNER)
     classifier.begin_classifier()
-    
+
+if args.command == 'plan':
+    shard_planner = sharding.ShardPlanner(args.database, args.shard_count, args.key)
+    print(BANNER)
+    shard_planner.commence_planning(args.output_directory)
+
+if args.command == 'merge':
+    shard_merger = sharding.ShardMerger(args.shard_plan, args.segments, args.output_database)
+    print(BANNER)
+    shard_merger.commence_merge()
@@ -0,0 +1,132 @@
+# Local Shard Check
+# Runs the whole sharded pipeline on one box, with separate processes standing in for nodes:
+# import a scratch directory, plan it, classify every shard in its own process, then merge.
+# Run it from the repo root with: python -m sharding.local_check
+import os
+import json
+import shutil
+import tempfile
+import multiprocessing
+
+import backend
+import classifier.classifier as classifier
+import sharding.sharding as sharding
+
+SHARD_COUNT = 3
+
+
+def _classify_shard(json_db, plugin_db, shard_plan, shard_index):
+    # One "node". We hand it an external plugin database so it doesn't try to build
+    # ./curator-tool/plugins.json, which needs every plugin's dependencies installed.
+    shard_classifier = classifier.FileClassifier(json_db, 'exts', False, None, plugin_db,
+                                                 (shard_index, SHARD_COUNT), shard_plan)
+    shard_classifier.begin_classifier()
+
+
+def _run_workers(json_db, plugin_db, shard_plan):
+    # Classify every shard in its own process, all at once, and return the segments they wrote
+    workers = [multiprocessing.Process(target=_classify_shard, args=(json_db, plugin_db, shard_plan, index))
+               for index in range(SHARD_COUNT)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        if worker.exitcode != 0:
+            raise AssertionError(f"Shard worker exited with {worker.exitcode}")
+
+    return ["{}.shard-{}-of-{}.json".format(os.path.splitext(json_db)[0], index, SHARD_COUNT)
+            for index in range(SHARD_COUNT)]
+
+
+def _check_merged(merged_db, expected_files):
+    # Every file in the database has to come out of the merge exactly once, classified
+    with open(merged_db, encoding="utf-8", mode="r") as merged_file:
+        merged_files = json.load(merged_file)["files"]
+    if len(merged_files) != expected_files or \
+       not all("classifier" in merged_file for merged_file in merged_files):
+        raise AssertionError("Merged database does not hold every classified file exactly once")
+    return len(merged_files)
+
+
+def _expect_failure(shard_plan, segments, output_db, reason):
+    # The merger should refuse these segments
+    try:
+        sharding.ShardMerger(shard_plan, segments, output_db).commence_merge()
+    except ValueError as error:
+        print(f"[local_check] OK: rejected {reason} ({error})")
+        return
+    raise AssertionError(f"Merger accepted {reason}")
+
+
+def run_check(work_directory):
+    """Run the sharded pipeline in work_directory and raise if anything is off
+
+    Args:
+        work_directory (str): an empty scratch directory
+    """
+    # Make some files of different sizes, plus a copy so the content key has something to group
+    data_directory = os.path.join(work_directory, "data")
+    os.makedirs(os.path.join(data_directory, "sub"))
+    for index in range(1, 31):
+        with open(os.path.join(data_directory, f"file{index}.csv"), mode="wb") as data_file:
+            data_file.write(os.urandom(index * 137))
+    shutil.copy(os.path.join(data_directory, "file3.csv"), os.path.join(data_directory, "sub", "copy.csv"))
+
+    backend.BackendImporter(data_directory, work_directory, True).commence_import()
+    json_db = os.path.join(work_directory, "backendimporter_db.json")
+
+    plugin_db = os.path.join(work_directory, "plugins.json")
+    with open(plugin_db, encoding="utf-8", mode="w") as plugin_file:
+        json.dump({
+            "file_information": {"last_update": 0, "total_plugins": 1},
+            "plugin_categories": ["extractor"],
+            "plugins": [{"CSVExtractor": {"associated_file_extensions": [".csv"]}}]
+        }, plugin_file)
+
+    shard_plan = sharding.ShardPlanner(json_db, SHARD_COUNT, 'content').commence_planning(work_directory)
+
+    segments = _run_workers(json_db, plugin_db, shard_plan)
+
+    # Merge with a segment passed twice, duplicates should be dropped
+    merged_db = os.path.join(work_directory, "merged_db.json")
+    sharding.ShardMerger(shard_plan, segments + segments[:1], merged_db).commence_merge()
+    merged_files = _check_merged(merged_db, 31)
+    print(f"[local_check] OK: merged {merged_files} file(s) from {SHARD_COUNT} worker process(es)")
+
+    # Merge with a segment missing, coverage should fail
+    _expect_failure(shard_plan, segments[1:], merged_db, "a missing segment")
+
+    # Copy the database somewhere else, like a node with its own local copy. The plan should still fit.
+    moved_directory = os.path.join(work_directory, "moved")
+    os.makedirs(moved_directory)
+    moved_db = os.path.join(moved_directory, "backendimporter_db.json")
+    shutil.copy(json_db, moved_db)
+    moved_segments = _run_workers(moved_db, plugin_db, shard_plan)
+    sharding.ShardMerger(shard_plan, moved_segments, merged_db).commence_merge()
+    merged_files = _check_merged(merged_db, 31)
+    print(f"[local_check] OK: merged {merged_files} file(s) from a database at a different path")
+
+    # Re-plan by path in a different directory, the old segments should not match the new plan
+    other_directory = os.path.join(work_directory, "other_plan")
+    os.makedirs(other_directory)
+    other_plan = sharding.ShardPlanner(json_db, SHARD_COUNT, 'path').commence_planning(other_directory)
+    _expect_failure(other_plan, segments, merged_db, "segments from a different plan")
+
+    # Re-import after planning. The new file is in no shard, so the workers have to refuse the plan.
+    new_directory = os.path.join(work_directory, "new_data")
+    os.makedirs(new_directory)
+    with open(os.path.join(new_directory, "new_file.csv"), mode="wb") as data_file:
+        data_file.write(os.urandom(512))
+    backend.BackendImporter(new_directory, work_directory, False).commence_import()
+    try:
+        _classify_shard(json_db, plugin_db, shard_plan, 0)
+    except ValueError as error:
+        print(f"[local_check] OK: rejected a plan made before a re-import ({error})")
+    else:
+        raise AssertionError("Worker accepted a plan made before a re-import")
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as work_directory:
+        run_check(work_directory)
+    print("[local_check] All checks passed")
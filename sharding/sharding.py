@@ -0,0 +1,316 @@
+# Shard Planner & Merger
+# When the archive is too big for a single box, we split the backend database into N
+# shards and hand one shard to each node. Every node classifies only its own slice and
+# writes its own segment, then the merger stitches the segments back into one database.
+from datetime import datetime
+
+import os
+import json
+import hashlib
+import argparse
+import logging
+
+
+def parse_shard_spec(shard_spec):
+    """Parse a shard spec like "2/8" into a (shard_index, shard_count) tuple
+
+    Args:
+        shard_spec (str): the shard spec, in the form "i/N" where 0 <= i < N
+
+    Returns:
+        tuple: (shard_index, shard_count)
+    """
+    try:
+        shard_index, shard_count = (int(part) for part in shard_spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec '{shard_spec}'. Use the form i/N, like 0/4.")
+
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard spec '{shard_spec}'. i must be between 0 and N-1.")
+
+    return shard_index, shard_count
+
+
+def database_fingerprint(gathered_files):
+    """Fingerprint the file list of a backend database, so a plan can be matched to the
+    database it was made from no matter where that database lives on each node
+
+    Args:
+        gathered_files (list): the "files" list of the backend database
+
+    Returns:
+        str: sha256 of the sorted full_path/filesize pairs
+    """
+    file_pairs = sorted([gathered_file["full_path"], gathered_file["filesize"]]
+                        for gathered_file in gathered_files)
+    return hashlib.sha256(json.dumps(file_pairs).encode("utf-8")).hexdigest()
+
+
+def shard_spec_argument(shard_spec):
+    """argparse type for --shard, so the user actually gets to see what was wrong with the spec"""
+    try:
+        return parse_shard_spec(shard_spec)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+class ShardPlanner:
+
+    KEYS = ['path', 'content']
+    # --------- [KEYS] --------
+    # path - Hash the full path of each file (cheap, no file reads)
+    # content - Hash the contents of each file, so identical files always land on the same shard
+
+    def __init__(self, json_db, shard_count, key='path'):
+        """Initialize the shard planner
+
+        Args:
+            json_db (str): location of the json database. usually it is "./backendimporter_db.json".
+            shard_count (int): the number of shards to split the database into
+            key (str, optional): what to hash when partitioning, path or content. Defaults to 'path'.
+        """
+
+        # Check if a valid key was specified
+        if key not in self.KEYS:
+            raise ValueError("Invalid Shard Key. Options are path or content.")
+
+        if shard_count < 1:
+            raise ValueError("Shard count must be at least 1.")
+
+        self.version = "dev-1.0"
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel(logging.INFO)
+        formatter = logging.Formatter('[open_asterisk/{}] %(message)s'.format(self.__class__.__name__))
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        self.logger.addHandler(console_handler)
+
+        self.json_db = json_db
+        self.shard_count = shard_count
+        self.key = key
+        self.filename = "shard_plan.json"
+
+        self._database = None # Contents of the backend database
+
+    def _load_database(self):
+        # Load the backend database so we know what we have to split up
+        self.logger.info("Loading backend database")
+
+        if not os.path.isfile(self.json_db):
+            raise FileNotFoundError("JSON Database Not Found.")
+
+        with open(self.json_db, encoding="utf-8", mode="r") as json_db:
+            self._database = json.load(json_db)
+
+        self.logger.info(f"Finished loading backend database. It contains {len(self._database['files'])} file(s).")
+
+    def _hash_file(self, gathered_file):
+        # Hash whatever we're keying on. Read in chunks so big dumps don't eat all our memory.
+        if self.key == "path":
+            return hashlib.sha256(gathered_file["full_path"].encode("utf-8")).hexdigest()
+
+        file_hash = hashlib.sha256()
+        with open(gathered_file["full_path"], mode="rb") as file_to_hash:
+            for chunk in iter(lambda: file_to_hash.read(1024 * 1024), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def _group_files(self):
+        # Group every file by its hash. Files that share a hash have to go to the same
+        # shard, that way identical content never gets processed on two different nodes.
+        self.logger.info(f"Hashing {len(self._database['files'])} file(s) by {self.key}")
+
+        groups = {}
+        for gathered_file in self._database["files"]:
+            file_hash = self._hash_file(gathered_file)
+            if file_hash not in groups:
+                groups[file_hash] = {"filesize": 0, "files": []}
+            groups[file_hash]["filesize"] += gathered_file["filesize"]
+            groups[file_hash]["files"].append(gathered_file["full_path"])
+
+        return groups
+
+    def _balance_groups(self, groups):
+        # Greedy balancing: hand out the biggest groups first, each one to whichever shard
+        # is currently the lightest. Ties are broken by the hash and then the shard index,
+        # so planning the same database twice gives the same shards, and the same fingerprint.
+        self.logger.info(f"Balancing {len(groups)} group(s) across {self.shard_count} shard(s)")
+
+        shards = [{"index": index, "filesize": 0, "files": []} for index in range(self.shard_count)]
+
+        for file_hash in sorted(groups, key=lambda file_hash: (-groups[file_hash]["filesize"], file_hash)):
+            lightest_shard = min(shards, key=lambda shard: (shard["filesize"], shard["index"]))
+            lightest_shard["filesize"] += groups[file_hash]["filesize"]
+            lightest_shard["files"].extend(groups[file_hash]["files"])
+
+        return shards
+
+    def generate_plan(self):
+        """Generate the shard plan for the database without writing it anywhere
+
+        Returns:
+            dict: the shard plan
+        """
+        self._load_database()
+        shards = self._balance_groups(self._group_files())
+
+        # Fingerprint the plan by its contents so the merger can tell plans apart, even ones
+        # written in the same second
+        fingerprint = hashlib.sha256(json.dumps({"key": self.key, "shards": shards},
+                                                sort_keys=True).encode("utf-8")).hexdigest()
+
+        plan = {
+            "header": {
+                "authors": ["ef1500", "request", "pog", "theangrybagel"],
+                "description": "Open Asterisk Curator Tool Shard Plan",
+                "version": self.version
+            },
+            "shard_info": {
+                # Only here so the user knows where the plan came from, workers match on the fingerprint
+                "database": os.path.abspath(self.json_db),
+                "database_fingerprint": database_fingerprint(self._database["files"]),
+                "key": self.key,
+                "shard_count": self.shard_count,
+                "total_files": len(self._database["files"]),
+                "total_filesize": sum(shard["filesize"] for shard in shards),
+                "fingerprint": fingerprint,
+                "creation_time": int((datetime.now() - datetime(1970, 1, 1)).total_seconds())
+            },
+            "shards": shards
+        }
+
+        for shard in shards:
+            self.logger.info(f"Shard {shard['index']}/{self.shard_count}: "
+                             f"{len(shard['files'])} file(s), {shard['filesize']} byte(s)")
+
+        return plan
+
+    def commence_planning(self, output_directory):
+        """Generate the shard plan and write it to the output directory
+
+        Args:
+            output_directory (str): the directory to write shard_plan.json to
+
+        Returns:
+            str: the path of the written shard plan
+        """
+        self.logger.info("Preparing shard plan")
+        plan = self.generate_plan()
+
+        plan_filepath = os.path.join(output_directory, self.filename)
+        with open(plan_filepath, encoding="utf-8", mode="w") as plan_file:
+            json.dump(plan, plan_file)
+
+        self.logger.info(f"Shard plan written to {plan_filepath}")
+        return plan_filepath
+
+
+class ShardMerger:
+
+    def __init__(self, shard_plan, segments, output_db):
+        """Initialize the shard merger
+
+        Args:
+            shard_plan (str): location of the shard plan the segments were made from
+            segments (list): locations of the segment databases written by each shard
+            output_db (str): where to write the merged database
+        """
+
+        self.version = "dev-1.0"
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel(logging.INFO)
+        formatter = logging.Formatter('[open_asterisk/{}] %(message)s'.format(self.__class__.__name__))
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        self.logger.addHandler(console_handler)
+
+        self.shard_plan = shard_plan
+        self.segments = segments
+        self.output_db = output_db
+
+        self._plan = None # Contents of the shard plan
+
+    def _load_plan(self):
+        # Load the shard plan so we know what the segments are supposed to contain
+        if not os.path.isfile(self.shard_plan):
+            raise FileNotFoundError("Shard Plan Not Found.")
+
+        with open(self.shard_plan, encoding="utf-8", mode="r") as plan_file:
+            self._plan = json.load(plan_file)
+
+    def _load_segment(self, segment_path):
+        # Load a segment and make sure it actually came from this plan
+        if not os.path.isfile(segment_path):
+            raise FileNotFoundError(f"Segment {segment_path} Not Found.")
+
+        with open(segment_path, encoding="utf-8", mode="r") as segment_file:
+            segment = json.load(segment_file)
+
+        shard_info = segment.get("shard")
+        if shard_info is None:
+            raise ValueError(f"{segment_path} is not a shard segment.")
+
+        if shard_info["plan_fingerprint"] != self._plan["shard_info"]["fingerprint"]:
+            raise ValueError(f"{segment_path} was not generated from {self.shard_plan}.")
+
+        return segment
+
+    def commence_merge(self):
+        """Merge the segments into one database, removing duplicates and checking coverage"""
+        self.logger.info(f"Merging {len(self.segments)} segment(s)")
+        self._load_plan()
+
+        shard_count = self._plan["shard_info"]["shard_count"]
+        planned_files = {shard["index"]: set(shard["files"]) for shard in self._plan["shards"]}
+
+        merged_database = None
+        merged_paths = set()
+        seen_shards = set()
+        duplicates = 0
+
+        for segment_path in self.segments:
+            segment = self._load_segment(segment_path)
+            shard_index = segment["shard"]["shard_index"]
+            seen_shards.add(shard_index)
+
+            # Use the header from the first segment, they're all copies of the original database's
+            if merged_database is None:
+                merged_database = {"header": segment["header"], "files": []}
+
+            for gathered_file in segment["files"]:
+                full_path = gathered_file["full_path"]
+                if full_path not in planned_files[shard_index]:
+                    raise ValueError(f"{full_path} in {segment_path} does not belong to shard "
+                                     f"{shard_index}/{shard_count}.")
+                # Segments can overlap if a node was rerun, so only keep the first copy
+                if full_path in merged_paths:
+                    duplicates += 1
+                    continue
+                merged_paths.add(full_path)
+                merged_database["files"].append(gathered_file)
+
+        self.logger.info(f"Removed {duplicates} duplicate file(s)")
+
+        # Now make sure every shard showed up and every planned file made it through
+        missing_shards = sorted(set(range(shard_count)) - seen_shards)
+        if missing_shards:
+            raise ValueError(f"Missing segment(s) for shard(s) {missing_shards} of {shard_count}.")
+
+        missing_files = set().union(*planned_files.values()) - merged_paths
+        if missing_files:
+            raise ValueError(f"{len(missing_files)} planned file(s) are missing from the segments, "
+                             f"e.g. {sorted(missing_files)[0]}.")
+
+        with open(self.output_db, encoding="utf-8", mode="w") as json_file_db:
+            json.dump(merged_database, json_file_db)
+
+        self.logger.info(f"Merged {len(merged_paths)} file(s) into {self.output_db}. Coverage is complete.")
+
+# Example Usage
+#if __name__ == '__main__':
+#    a = ShardPlanner("./backendimporter_db.json", 4, 'path')
+#    a.commence_planning("./")
+#    b = ShardMerger("./shard_plan.json", ["./backendimporter_db.shard-0-of-4.json"], "./merged_db.json")
+#    b.commence_merge()